@@ -0,0 +1,114 @@
+"""
+Scores many steps at once with any of the reward modules.
+
+evaluate(module_name, params_list) groups the steps by track, so steps sharing
+a track run back to back against the same cached precomputes, then runs the
+module's batch kernel if it has one in BATCH_KERNELS, or its reward_function
+per step otherwise.
+"""
+import importlib
+import math
+
+import numpy as np
+
+import step_params
+
+REWARD_MODULES = ( 'reward_function', 'reward_function_2', 'reward_function_vk', 'simple_reward_function' )
+
+def load_module(module_name):
+    if module_name not in REWARD_MODULES:
+        raise ValueError("unknown reward module %r, expected one of %s" % (module_name, ', '.join(REWARD_MODULES)))
+    return importlib.import_module(module_name)
+
+def _column(params_list, name, dtype=np.float64):
+    return np.fromiter((params[name] for params in params_list), dtype=dtype, count=len(params_list))
+
+def simple_reward_batch(params_list):
+    """ simple_reward_function.reward_function over a batch of steps """
+    n = len(params_list)
+    all_wheels_on_track = _column(params_list, 'all_wheels_on_track', bool)
+    progress = _column(params_list, 'progress')
+    steering = np.abs(_column(params_list, 'steering_angle'))
+    speed = _column(params_list, 'speed')
+    is_reversed = _column(params_list, 'is_reversed', bool)
+    heading = _column(params_list, 'heading')
+    track_width = _column(params_list, 'track_width')
+    distance_from_center = _column(params_list, 'distance_from_center')
+
+    track_direction = np.empty(n)
+    for i, params in enumerate(params_list):
+        prev_index, next_index = params['closest_waypoints']
+        next_point = params['waypoints'][next_index]
+        prev_point = params['waypoints'][prev_index]
+        track_direction[i] = math.atan2(next_point[1] - prev_point[1], next_point[0] - prev_point[0])
+    track_direction = np.degrees(track_direction)
+
+    progress = np.where(is_reversed, -progress, progress)
+    reward = 3.0 * progress
+    reward -= 2.5 * steering
+    reward -= np.where(is_reversed & (progress > 0), 5.0, 0.0)
+    reward -= np.where(all_wheels_on_track, 0.0, 15.0)
+    reward += 2.0 * (1.0 - distance_from_center / (track_width / 2.0))
+    reward = np.where(speed < 0.8, reward * 0.7, reward + 5.0 * speed)
+
+    direction_diff = np.abs(track_direction - heading)
+    direction_diff = np.where(direction_diff > 180, 360 - direction_diff, direction_diff)
+    reward = np.where(direction_diff > 10.0, reward * 0.5, reward)
+    return reward
+
+BATCH_KERNELS = {
+    'simple_reward_function': simple_reward_batch,
+}
+
+def group_by_track(params_list):
+    """
+    Indexes of params_list grouped by track key. Waypoints lists shared by consecutive steps are looked up once,
+    and step_params memoizes the keys of tracks it has seen, so a fresh copy of a known track is not hashed again.
+    """
+    groups = {}
+    last_waypoints, last_key = None, None
+    for i, params in enumerate(params_list):
+        waypoints = params['waypoints']
+        if waypoints is not last_waypoints:
+            last_waypoints, last_key = waypoints, step_params.get_track_key(waypoints)
+        groups.setdefault(last_key, []).append(i)
+    return groups
+
+def reward_value(reward):
+    # reward_function_2 returns its reward wrapped in a list, or an empty list when it is zeroed
+    if isinstance(reward, (list, tuple)):
+        return float(sum(reward))
+    return float(reward)
+
+def evaluate(module_name, params_list):
+    """
+    Rewards for a batch of steps, in the order of params_list.
+    :param module_name: one of REWARD_MODULES
+    :param params_list: list of params dicts as given to reward_function
+    :return: list of rewards as floats
+    """
+    module = load_module(module_name)
+    kernel = BATCH_KERNELS.get(module_name)
+    rewards = [None] * len(params_list)
+    for indexes in group_by_track(params_list).values():
+        steps = [params_list[i] for i in indexes]
+        if kernel is not None:
+            results = kernel(steps).tolist()
+        else:
+            results = [module.reward_function(params) for params in steps]
+        for i, reward in zip(indexes, results):
+            rewards[i] = reward_value(reward)
+    return rewards
+
+def evaluate_each(module_name, params_list):
+    """
+    Like evaluate, but scores the steps one at a time so a step the module fails on does not fail the others.
+    :return: list holding the reward of every step, or the exception it raised
+    """
+    results = []
+    for params in params_list:
+        try:
+            results.append(evaluate(module_name, [params])[0])
+        except Exception as error:
+            results.append(error)
+    return results
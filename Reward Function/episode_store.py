@@ -0,0 +1,78 @@
+"""
+Columnar store of logged steps.
+
+A store is a directory with one .npy file per column (episode, steps, x, y,
+speed, ...), one row per step. Columns are loaded with np.load(mmap_mode='r'),
+so plotting or re-scoring a whole training run only reads the columns it uses.
+
+    columns = episode_store.columns_from_steps(params_iterable)
+    episode_store.save_columns('runs/run_1', columns)
+    columns = episode_store.load_columns('runs/run_1', ['episode', 'x', 'y'])
+"""
+import json
+import os
+
+import numpy as np
+
+STEP_COLUMNS = ( 'x', 'y', 'heading', 'speed', 'steering_angle', 'progress', 'steps', 'closest_waypoints',
+                 'distance_from_center', 'all_wheels_on_track', 'is_offtrack', 'is_crashed', 'is_left_of_center',
+                 'is_reversed' )
+
+def columns_from_steps(steps, rewards=None, track=None):
+    """
+    Builds columns from params dicts in logged order, a new episode starts when `steps` does not increase.
+    Columns missing from the first step are left out.
+    :param steps: iterable of params dicts
+    :param rewards: optional rewards of the steps, stored as the 'reward' column
+    :param track: optional track name of the run, stored as the 'track' column
+    """
+    values = None
+    episode = []
+    current_episode, previous_steps = -1, None
+    for params in steps:
+        if values is None:
+            values = { name: [] for name in STEP_COLUMNS if name in params }
+        if previous_steps is None or params['steps'] <= previous_steps:
+            current_episode += 1
+        previous_steps = params['steps']
+        episode.append(current_episode)
+        for name in values:
+            values[name].append(params[name])
+    columns = { name: np.asarray(column) for name, column in (values or {}).items() }
+    columns['episode'] = np.asarray(episode, dtype=np.int64)
+    if rewards is not None:
+        columns['reward'] = np.asarray(rewards, dtype=np.float64)
+    if track is not None:
+        columns['track'] = np.full(len(episode), track)
+    return columns
+
+def concat_columns(runs):
+    """ one store of several runs, e.g. on different tracks, episode numbers are kept distinct """
+    names = set.intersection(*[ set(columns) for columns in runs ])
+    offsets = np.cumsum([0] + [ int(columns['episode'].max()) + 1 if len(columns['episode']) else 0 for columns in runs ])
+    combined = { name: np.concatenate([ columns[name] for columns in runs ]) for name in names }
+    combined['episode'] = np.concatenate([ columns['episode'] + offset for columns, offset in zip(runs, offsets) ])
+    return combined
+
+def read_steps(steps_path):
+    """ params dicts of a JSON-lines step log, one object per line """
+    with open(steps_path) as steps:
+        for line in steps:
+            if line.strip():
+                yield json.loads(line)
+
+def save_columns(store_path, columns):
+    os.makedirs(store_path, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(store_path, name + '.npy'), np.asarray(column))
+
+def load_columns(store_path, names=None):
+    """ memory mapped columns of a store, all of them when names is None """
+    if names is None:
+        names = [ entry[:-len('.npy')] for entry in sorted(os.listdir(store_path)) if entry.endswith('.npy') ]
+    return { name: np.load(os.path.join(store_path, name + '.npy'), mmap_mode='r') for name in names }
+
+def episode_bounds(episode):
+    """ start and stop row of every episode, the episode column must be grouped """
+    starts = np.flatnonzero(np.diff(episode, prepend=np.nan) != 0)
+    return starts, np.append(starts[1:], len(episode))
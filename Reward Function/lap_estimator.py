@@ -0,0 +1,205 @@
+"""
+Cheap first-pass screen of the reward candidates without training.
+
+Drives a kinematic bicycle model around a track from the .npy track files
+(centerline, inner and outer border, as loaded in deepracer_analysis.ipynb)
+with a policy that greedily maximises the candidate reward: at every step each
+action of the action space is held for `horizon` steps, the resulting states
+are scored with batch_evaluator and the best action is taken. All rollouts and
+all actions are simulated together as numpy arrays, only the reward calls are
+per step.
+
+The reported lap time and off-track rate are those of the behaviour a reward
+induces under this policy, which is a ranking signal, not a prediction of the
+trained model.
+
+    python lap_estimator.py tracks/reInvent2019_track.npy --rollouts 8 --horizon 2
+"""
+import argparse
+import math
+
+import numpy as np
+
+import batch_evaluator
+
+STEPS_PER_SECOND = 15
+WHEELBASE = 0.165
+CAR_WIDTH = 0.2
+STEERING_ANGLES = ( -30.0, -15.0, 0.0, 15.0, 30.0 )
+SPEEDS = ( 1.0, 2.0, 3.0, 4.0 )
+
+def load_track(track_path):
+    """ center line, inner border and outer border of a track file """
+    waypoints = np.load(track_path)
+    return waypoints[:, 0:2], waypoints[:, 2:4], waypoints[:, 4:6]
+
+def get_action_space(steering_angles=STEERING_ANGLES, speeds=SPEEDS):
+    return np.array([ (steering, speed) for steering in steering_angles for speed in speeds ])
+
+def score(module_name, params_list):
+    """ rewards of a batch, steps the module fails on score -inf so the policy avoids them """
+    try:
+        rewards = batch_evaluator.evaluate(module_name, params_list)
+    except Exception:
+        # an unknown module name still raises
+        batch_evaluator.load_module(module_name)
+        rewards = [ -math.inf if isinstance(reward, Exception) else reward
+                    for reward in batch_evaluator.evaluate_each(module_name, params_list) ]
+    return np.array(rewards)
+
+class Track:
+    def __init__(self, center_line, track_width):
+        self.center_line = np.asarray(center_line, dtype=np.float64)
+        self.track_width = float(track_width)
+        self.waypoints = [ tuple(point) for point in self.center_line.tolist() ]
+        self.segment_start = self.center_line[:-1]
+        self.segment = np.diff(self.center_line, axis=0)
+        self.segment_length = np.linalg.norm(self.segment, axis=1)
+        self.segment_offset = np.concatenate([[0.0], np.cumsum(self.segment_length)])[:-1]
+        self.length = float(self.segment_length.sum())
+
+    @classmethod
+    def from_file(cls, track_path):
+        center_line, inner_border, outer_border = load_track(track_path)
+        return cls(center_line, np.linalg.norm(outer_border - inner_border, axis=1).mean())
+
+    def project(self, x, y):
+        """
+        Projects positions on the center line.
+        :return: closest segment index, distance from center, arc length, left of center flags
+        """
+        dx = x[:, None] - self.segment_start[:, 0]
+        dy = y[:, None] - self.segment_start[:, 1]
+        t = (dx * self.segment[:, 0] + dy * self.segment[:, 1]) / np.maximum(self.segment_length ** 2, 1e-12)
+        t = np.clip(t, 0.0, 1.0)
+        distances = np.hypot(dx - t * self.segment[:, 0], dy - t * self.segment[:, 1])
+        index = distances.argmin(axis=1)
+        rows = np.arange(len(x))
+        cross = self.segment[index, 0] * dy[rows, index] - self.segment[index, 1] * dx[rows, index]
+        arc_length = self.segment_offset[index] + t[rows, index] * self.segment_length[index]
+        return index, distances[rows, index], arc_length, cross > 0
+
+def step_model(x, y, heading, steering, speed):
+    """ kinematic bicycle model over one simulator step, headings in degrees """
+    dt = 1.0 / STEPS_PER_SECOND
+    heading = heading + np.degrees(speed * dt / WHEELBASE * np.tan(np.radians(steering)))
+    heading = (heading + 180) % 360 - 180
+    return x + speed * dt * np.cos(np.radians(heading)), y + speed * dt * np.sin(np.radians(heading)), heading
+
+def build_params(track, projection, x, y, heading, steering, speed, progress, steps):
+    """ simulator params of every row, projection is track.project(x, y) """
+    index, distance_from_center, _, is_left = projection
+    half_width = track.track_width / 2
+    params_list = []
+    for i in range(len(x)):
+        params_list.append({
+            "all_wheels_on_track": bool(distance_from_center[i] + CAR_WIDTH / 2 <= half_width),
+            "x": float(x[i]),
+            "y": float(y[i]),
+            "closest_waypoints": [int(index[i]), int(index[i] + 1)],
+            "distance_from_center": float(distance_from_center[i]),
+            "is_crashed": False,
+            "is_left_of_center": bool(is_left[i]),
+            "is_offtrack": bool(distance_from_center[i] - CAR_WIDTH / 2 > half_width),
+            "is_reversed": False,
+            "heading": float(heading[i]),
+            "progress": float(progress[i]),
+            "speed": float(speed[i]),
+            "steering_angle": float(steering[i]),
+            "steps": int(steps),
+            "track_length": track.length,
+            "track_width": track.track_width,
+            "waypoints": track.waypoints,
+        })
+    return params_list
+
+def update_progress(track, travelled, arc_length, previous_arc_length):
+    # wrap the arc length delta so crossing the start line is not a jump of one lap
+    delta = (arc_length - previous_arc_length + track.length / 2) % track.length - track.length / 2
+    travelled = travelled + delta
+    return travelled, np.clip(travelled / track.length * 100, 0.0, 100.0)
+
+def estimate(module_name, track, n_rollouts=8, horizon=1, max_steps=1500, actions=None):
+    """
+    Greedy rollouts of a reward module around a track.
+    :param module_name: one of batch_evaluator.REWARD_MODULES
+    :param track: Track
+    :param n_rollouts: rollouts run in parallel, starting at evenly spaced waypoints
+    :param horizon: number of steps each candidate action is held while scoring it
+    :param max_steps: rollouts that do not finish in time count as unfinished
+    :return: dict with lap times in seconds of the finished rollouts, off-track rate and finish rate
+    """
+    actions = get_action_space() if actions is None else actions
+    n_actions = len(actions)
+    start = np.linspace(0, len(track.waypoints) - 1, n_rollouts, endpoint=False).astype(int)
+    x, y = track.center_line[start, 0].copy(), track.center_line[start, 1].copy()
+    heading = np.degrees(np.arctan2(track.segment[start, 1], track.segment[start, 0]))
+    _, _, arc_length, _ = track.project(x, y)
+    travelled = np.zeros(n_rollouts)
+    progress = np.zeros(n_rollouts)
+    active = np.ones(n_rollouts, dtype=bool)
+    off_track = np.zeros(n_rollouts, dtype=bool)
+    lap_steps = np.full(n_rollouts, np.nan)
+
+    for steps in range(1, max_steps + 1):
+        rollouts = np.flatnonzero(active)
+        if not len(rollouts):
+            break
+        # every active rollout tries every action, rows are rollout-major
+        cx, cy, ch = (np.repeat(values[rollouts], n_actions) for values in (x, y, heading))
+        steering = np.tile(actions[:, 0], len(rollouts))
+        speed = np.tile(actions[:, 1], len(rollouts))
+        c_arc = np.repeat(arc_length[rollouts], n_actions)
+        c_travelled = np.repeat(travelled[rollouts], n_actions)
+        scores = np.zeros(len(cx))
+        for ahead in range(horizon):
+            cx, cy, ch = step_model(cx, cy, ch, steering, speed)
+            projection = track.project(cx, cy)
+            c_travelled, c_progress = update_progress(track, c_travelled, projection[2], c_arc)
+            c_arc = projection[2]
+            params_list = build_params(track, projection, cx, cy, ch, steering, speed, c_progress, steps + ahead)
+            scores += score(module_name, params_list)
+        best = scores.reshape(len(rollouts), n_actions).argmax(axis=1)
+
+        chosen = actions[best]
+        x[rollouts], y[rollouts], heading[rollouts] = step_model(x[rollouts], y[rollouts], heading[rollouts], chosen[:, 0], chosen[:, 1])
+        index, distance_from_center, next_arc, _ = track.project(x[rollouts], y[rollouts])
+        travelled[rollouts], progress[rollouts] = update_progress(track, travelled[rollouts], next_arc, arc_length[rollouts])
+        arc_length[rollouts] = next_arc
+
+        went_off = distance_from_center - CAR_WIDTH / 2 > track.track_width / 2
+        finished = progress[rollouts] >= 100
+        off_track[rollouts[went_off]] = True
+        lap_steps[rollouts[finished & ~went_off]] = steps
+        active[rollouts[went_off | finished]] = False
+
+    lap_times = lap_steps[~np.isnan(lap_steps)] / STEPS_PER_SECOND
+    return {
+        'module': module_name,
+        'lap_times': lap_times,
+        'mean_lap_time': float(lap_times.mean()) if len(lap_times) else math.nan,
+        'off_track_rate': float(off_track.mean()),
+        'finish_rate': len(lap_times) / n_rollouts,
+    }
+
+def rank(track, module_names=batch_evaluator.REWARD_MODULES, **kwargs):
+    """ estimates of every module, best first: most finishes, then fastest laps """
+    results = [ estimate(module_name, track, **kwargs) for module_name in module_names ]
+    return sorted(results, key=lambda result: (-result['finish_rate'], np.nan_to_num(result['mean_lap_time'], nan=math.inf)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('track', help='.npy track file')
+    parser.add_argument('--modules', nargs='+', default=batch_evaluator.REWARD_MODULES)
+    parser.add_argument('--rollouts', type=int, default=8)
+    parser.add_argument('--horizon', type=int, default=1)
+    parser.add_argument('--max-steps', type=int, default=1500)
+    args = parser.parse_args()
+    track = Track.from_file(args.track)
+    print('%-24s %10s %10s %10s' % ('module', 'lap time', 'finished', 'off track'))
+    for result in rank(track, args.modules, n_rollouts=args.rollouts, horizon=args.horizon, max_steps=args.max_steps):
+        print('%-24s %9.2fs %9.0f%% %9.0f%%' % (result['module'], result['mean_lap_time'],
+                                                  result['finish_rate'] * 100, result['off_track_rate'] * 100))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+Deterministic load test of a reward module.
+
+Replays a corpus of logged steps (one params JSON object per line) against a
+reward module from N threads or processes. Every worker starts at its own
+offset in the corpus and calls reward_function on a fixed open-loop schedule of
+`rate / workers` steps per second (as fast as it can with --rate 0), so two runs
+with the same arguments issue the same calls at the same times. Latency is
+measured from the scheduled time, so a stalled worker shows up in the tail
+instead of silently lowering the rate.
+
+Every interval it reports sustained steps/sec, latency percentiles and the RSS
+of the workers. At the end it fits the RSS growth over the run and lists the
+module-level containers (dicts, lists, sets) of the reward modules that kept
+growing, such as unbounded caches or per-step globals.
+
+With --processes the per-track caches are computed once in the parent for every
+track of the corpus and published to shared memory (see track_cache), so the
+workers attach to one copy instead of each warming their own, as simulator
+workers sharing a host would.
+
+    python load_test.py reward_function steps.jsonl --workers 10 --processes --rate 1500 --duration 3600
+"""
+import argparse
+import collections
+import contextlib
+import importlib
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+import batch_evaluator
+import episode_store
+import track_cache
+
+MODULES = batch_evaluator.REWARD_MODULES + ( 'test_case', )
+BUCKETS_PER_DECADE = 20
+MIN_LATENCY = 1e-6
+N_BUCKETS = 8 * BUCKETS_PER_DECADE
+# seconds between checks for workers that died without reporting
+POLL_TIMEOUT = 1.0
+
+class LatencyHistogram:
+    """ log-bucketed latencies from 1us to 100s, fixed memory however long the run """
+    def __init__(self):
+        self.counts = np.zeros(N_BUCKETS + 1, dtype=np.int64)
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = int(math.log10(max(seconds, MIN_LATENCY) / MIN_LATENCY) * BUCKETS_PER_DECADE)
+        self.counts[min(bucket, N_BUCKETS)] += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """ upper bound of the bucket holding the q-th percentile, in seconds """
+        total = self.counts.sum()
+        if not total:
+            return math.nan
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q / 100 * total))
+        return min(MIN_LATENCY * 10 ** ((bucket + 1) / BUCKETS_PER_DECADE), self.max)
+
+def get_rss():
+    """ resident set size of this process in bytes """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # peak rather than current RSS, still shows growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def module_state_sizes():
+    """ length of every module-level container of the modules in this directory """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    sizes = {}
+    for module_name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if not path or os.path.dirname(os.path.abspath(path)) != directory:
+            continue
+        for name, value in list(vars(module).items()):
+            if isinstance(value, (dict, list, set, collections.deque)) and not name.startswith('__'):
+                sizes['%s.%s' % (module_name, name)] = len(value)
+    return sizes
+
+def load_corpus(steps_path):
+    """ logged steps, waypoints turned back into one shared list of tuples per track as the simulator passes them """
+    tracks = {}
+    corpus = []
+    for params in episode_store.read_steps(steps_path):
+        waypoints = tuple(tuple(point) for point in params['waypoints'])
+        params['waypoints'] = tracks.setdefault(waypoints, list(waypoints))
+        corpus.append(params)
+    return corpus
+
+Snapshot = collections.namedtuple('Snapshot', [ 'worker', 'interval', 'steps', 'histogram', 'rss', 'state_sizes', 'errors' ])
+
+def run_worker(reward_function, corpus, worker, n_workers, rate, duration, interval, report):
+    period = n_workers / rate if rate else 0.0
+    offset = worker * len(corpus) // n_workers
+    start = time.perf_counter()
+    histogram, steps, errors, current_interval = LatencyHistogram(), 0, 0, 0
+    i = 0
+    while True:
+        scheduled = start + i * period
+        now = time.perf_counter()
+        if now - start >= duration:
+            break
+        while int((now - start) // interval) > current_interval:
+            report(Snapshot(worker, current_interval, steps, histogram, get_rss(), module_state_sizes(), errors))
+            histogram, steps, errors, current_interval = LatencyHistogram(), 0, 0, current_interval + 1
+        if scheduled > now:
+            time.sleep(scheduled - now)
+        # open loop: a call that starts late because earlier ones were slow counts the wait
+        begin = scheduled if period else time.perf_counter()
+        params = dict(corpus[(offset + i) % len(corpus)])
+        try:
+            reward_function(params)
+        except Exception:
+            errors += 1
+        histogram.add(time.perf_counter() - begin)
+        steps += 1
+        i += 1
+    report(Snapshot(worker, current_interval, steps, histogram, get_rss(), module_state_sizes(), errors))
+
+def publish_tracks(reward_function, corpus):
+    """ computes and publishes the track caches the module fills, from the first step of every track and direction """
+    seen = set()
+    track_cache.set_publishing(True)
+    try:
+        for params in corpus:
+            track = (id(params['waypoints']), params.get('is_reversed'))
+            if track in seen:
+                continue
+            seen.add(track)
+            try:
+                reward_function(dict(params))
+            except Exception:
+                # the workers count the errors
+                pass
+    finally:
+        track_cache.set_publishing(False)
+
+def _process_worker(module_name, steps_path, worker, n_workers, rate, duration, interval, reports):
+    try:
+        # test_case prints on every step
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            reward_function = importlib.import_module(module_name).reward_function
+            run_worker(reward_function, load_corpus(steps_path), worker, n_workers, rate, duration, interval, reports.put)
+    finally:
+        # run() counts these to know when every worker is done, a failed worker has to send it too
+        reports.put(None)
+
+def run(module_name, steps_path, workers=1, processes=False, rate=0.0, duration=60.0, interval=10.0, out=None):
+    """
+    Runs the load test and prints a line per interval and a summary to `out`.
+    :return: summary dict with steps/sec, latency percentiles, RSS growth rate, growing module containers and failed workers
+    """
+    out = out or sys.stdout
+    if next(episode_store.read_steps(steps_path), None) is None:
+        raise ValueError('no steps in %s' % steps_path)
+    failed = []
+    devnull = open(os.devnull, 'w')
+    if processes:
+        with contextlib.redirect_stdout(devnull):
+            publish_tracks(importlib.import_module(module_name).reward_function, load_corpus(steps_path))
+        context = multiprocessing.get_context('spawn')
+        reports = context.Queue()
+        runners = [ context.Process(target=_process_worker, args=(module_name, steps_path, worker, workers, rate, duration, interval, reports))
+                    for worker in range(workers) ]
+    else:
+        corpus = load_corpus(steps_path)
+        with contextlib.redirect_stdout(devnull):
+            reward_function = importlib.import_module(module_name).reward_function
+        reports = queue.Queue()
+
+        def thread_worker(worker):
+            try:
+                run_worker(reward_function, corpus, worker, workers, rate, duration, interval, reports.put)
+            except Exception as error:
+                failed.append('worker %d: %s: %s' % (worker, type(error).__name__, error))
+            finally:
+                reports.put(None)
+
+        runners = [ threading.Thread(target=thread_worker, args=(worker,)) for worker in range(workers) ]
+
+    print('%8s %10s %10s %10s %10s %10s %8s' % ('interval', 'steps/s', 'p50 ms', 'p99 ms', 'p99.9 ms', 'rss MB', 'errors'), file=out)
+    pending = collections.defaultdict(dict)
+    rows, first_sizes, last_sizes = [], {}, {}
+    total = LatencyHistogram()
+    finished = 0
+    # reward prints of the worker threads go to devnull, the report goes to `out`
+    with devnull, contextlib.redirect_stdout(devnull):
+        for runner in runners:
+            runner.start()
+        while finished < workers:
+            try:
+                snapshot = reports.get(timeout=POLL_TIMEOUT)
+            except queue.Empty:
+                # a process killed outright never sends its sentinel
+                if not any(runner.is_alive() for runner in runners):
+                    break
+                continue
+            if snapshot is None:
+                finished += 1
+                continue
+            pending[snapshot.interval][snapshot.worker] = snapshot
+            first_sizes.setdefault(snapshot.worker, snapshot.state_sizes)
+            last_sizes[snapshot.worker] = snapshot.state_sizes
+            # an interval is complete once every worker reported it, the last one may be partial
+            for index in sorted(pending):
+                if len(pending[index]) < workers:
+                    break
+                snapshots = pending.pop(index).values()
+                histogram = LatencyHistogram()
+                for worker_snapshot in snapshots:
+                    histogram.merge(worker_snapshot.histogram)
+                total.merge(histogram)
+                steps = sum(worker_snapshot.steps for worker_snapshot in snapshots)
+                # threads share one process, processes each have their own
+                rss = sum(s.rss for s in snapshots) if processes else max(s.rss for s in snapshots)
+                errors = sum(worker_snapshot.errors for worker_snapshot in snapshots)
+                rows.append((index, steps / interval, rss))
+                print('%8d %10.0f %10.3f %10.3f %10.3f %10.1f %8d' % (
+                    index, steps / interval, histogram.percentile(50) * 1e3, histogram.percentile(99) * 1e3,
+                    histogram.percentile(99.9) * 1e3, rss / 2 ** 20, errors), file=out)
+        for runner in runners:
+            runner.join()
+    if processes:
+        track_cache.clear(unlink=True)
+        failed += [ 'worker %d: exit code %d' % (worker, runner.exitcode) for worker, runner in enumerate(runners) if runner.exitcode ]
+    for failure in failed:
+        print('failed %s' % failure, file=out)
+    summary = summarize(rows, total, first_sizes, last_sizes, interval, out)
+    summary['failed_workers'] = failed
+    return summary
+
+def summarize(rows, total, first_sizes, last_sizes, interval, out):
+    # the last interval is usually partial, leave it out of the rates
+    full_rows = rows[:-1] if len(rows) > 1 else rows
+    rss_growth = math.nan
+    warm = full_rows[len(full_rows) // 10:]
+    if len(warm) >= 3:
+        times = np.array([ row[0] * interval for row in warm ]) / 3600
+        rss_growth = float(np.polyfit(times, np.array([ row[2] for row in warm ]) / 2 ** 20, 1)[0])
+    growing = {}
+    for worker, sizes in last_sizes.items():
+        for name, size in sizes.items():
+            grown = size - first_sizes[worker].get(name, 0)
+            if grown > 0:
+                growing[name] = max(growing.get(name, 0), grown)
+    summary = {
+        'steps_per_second': float(np.mean([ row[1] for row in full_rows ])) if full_rows else math.nan,
+        'p50': total.percentile(50),
+        'p99': total.percentile(99),
+        'p999': total.percentile(99.9),
+        'max': total.max,
+        'rss_growth_mb_per_hour': rss_growth,
+        'growing_state': growing,
+    }
+    print('sustained %.0f steps/s, p50 %.3f ms, p99 %.3f ms, p99.9 %.3f ms, max %.3f ms, rss growth %.1f MB/h' % (
+        summary['steps_per_second'], summary['p50'] * 1e3, summary['p99'] * 1e3, summary['p999'] * 1e3,
+        summary['max'] * 1e3, rss_growth), file=out)
+    for name, grown in sorted(growing.items(), key=lambda item: -item[1]):
+        print('module state grew: %s +%d entries' % (name, grown), file=out)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('module', choices=MODULES)
+    parser.add_argument('steps', help='file with one params JSON object per line')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--processes', action='store_true', help='run workers as processes instead of threads')
+    parser.add_argument('--rate', type=float, default=0.0, help='total steps/sec over all workers, 0 for as fast as possible')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds')
+    parser.add_argument('--interval', type=float, default=10.0, help='seconds between reports')
+    args = parser.parse_args()
+    run(args.module, args.steps, args.workers, args.processes, args.rate, args.duration, args.interval)
+
+if __name__ == '__main__':
+    main()
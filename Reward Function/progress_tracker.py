@@ -0,0 +1,104 @@
+"""
+Per-episode rolling features for rate based reward shaping.
+
+The simulator only hands the reward absolute progress and steps. EpisodeTracker
+is fed every step's params and keeps the last WINDOW_SIZE values of progress,
+speed and steering change in fixed size ring buffers with running sums, so
+features like progress per step over the last 10 steps cost O(1) per step and
+nothing is allocated after the tracker is created. A step whose `steps` does
+not increase starts a new episode and resets the buffers.
+
+    tracker = progress_tracker.update(params)
+    if tracker.progress_rate(10) > 0.5:
+        ...
+"""
+import threading
+
+WINDOW_SIZE = 32
+
+class RingBuffer:
+    """ fixed size buffer of the last `size` floats with a running sum """
+    def __init__(self, size):
+        self.values = [0.0] * size
+        self.size = size
+        self.count = 0
+        self.head = 0
+        self.total = 0.0
+
+    def clear(self):
+        self.count = 0
+        self.head = 0
+        self.total = 0.0
+
+    def append(self, value):
+        if self.count == self.size:
+            self.total -= self.values[self.head]
+        else:
+            self.count += 1
+        self.values[self.head] = value
+        self.total += value
+        self.head = (self.head + 1) % self.size
+
+    def ago(self, n):
+        """ the value appended n steps before the last one, 0 is the last one """
+        n = min(n, self.count - 1)
+        return self.values[(self.head - 1 - n) % self.size]
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+class EpisodeTracker:
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.progress = RingBuffer(window_size + 1)
+        self.speed = RingBuffer(window_size)
+        self.steering_change = RingBuffer(window_size)
+        self.steps = None
+        self.steering_angle = 0.0
+        self.progress_gain = 0.0
+
+    def reset(self):
+        for buffer in (self.progress, self.speed, self.steering_change):
+            buffer.clear()
+        self.steps = None
+        self.progress_gain = 0.0
+
+    def update(self, params):
+        steps = params['steps']
+        if self.steps is not None and steps <= self.steps:
+            self.reset()
+        if self.steps is None:
+            self.steering_angle = params['steering_angle']
+        self.progress_gain = params['progress'] - self.progress.ago(0) if self.progress.count else 0.0
+        self.progress.append(params['progress'])
+        self.speed.append(params['speed'])
+        self.steering_change.append(abs(params['steering_angle'] - self.steering_angle))
+        self.steering_angle = params['steering_angle']
+        self.steps = steps
+        return self
+
+    def progress_rate(self, n=10):
+        """ progress per step over the last n steps, fewer at the start of an episode """
+        n = min(n, self.progress.count - 1)
+        if n <= 0:
+            return 0.0
+        return (self.progress.ago(0) - self.progress.ago(n)) / n
+
+    def mean_speed(self):
+        """ mean speed over the window """
+        return self.speed.mean()
+
+    def steering_jerk(self):
+        """ mean absolute steering angle change per step over the window, in degrees """
+        return self.steering_change.mean()
+
+_local = threading.local()
+
+def get_tracker():
+    """ tracker of the calling thread, rollout workers running in threads get their own """
+    tracker = getattr(_local, 'tracker', None)
+    if tracker is None:
+        tracker = _local.tracker = EpisodeTracker()
+    return tracker
+
+def update(params):
+    return get_tracker().update(params)
@@ -29,6 +29,13 @@ params = {
 import math
 import numpy as np
 from scipy import signal
+try:
+    # local tooling next to this file, missing when it is uploaded on its own
+    import track_cache
+    import track_artifacts
+    import step_params
+except ImportError:
+    track_cache = track_artifacts = step_params = None
 
 def distance(p1, p2):
     """ Euclidean distance between two points """ 
@@ -57,6 +64,10 @@ def up_sample(waypoints, factor):
 
 def get_waypoints(params, scaling_factor):
     """ Way-points """
+    if step_params is not None:
+        # cached array per track and direction, sliced without copying
+        waypoints = step_params.get_waypoint_array(params['waypoints'], params['is_reversed'], getattr(params, 'track_key', None))
+        return waypoints[params["closest_waypoints"][1]: ]
     if params['is_reversed']: # driving clock wise.
         waypoints = list(reversed(params['waypoints']))
     else: # driving counter clock wise.
@@ -96,11 +107,19 @@ def target_angle(params):
     wp = get_waypoints(params, 2)
     return angle(wp[0], wp[1])    
 
+def get_turn_point_flags(waypoints, key=None):
+    """ `i in get_turn_points(waypoints)` for every waypoint index i, from the track artifacts, computed once per track """
+    def compute(wp):
+        turn_flags = track_artifacts.get_artifacts(wp)['turn_flags']
+        turn_points = [ wp[i] for i in np.flatnonzero(turn_flags) ]
+        return np.array([ i in turn_points for i in range(len(wp)) ])
+    return track_cache.get_track_data(waypoints, 'turn_point_flags', compute, key=key)
+
 def is_a_turn_coming_up( params ):
     next_way_point = params["closest_waypoints"][1]
-    if next_way_point in get_turn_points( params['waypoints'] ):
-        return True
-    return False
+    if track_cache is None:
+        return next_way_point in get_turn_points(params['waypoints'])
+    return bool( get_turn_point_flags( params['waypoints'], getattr(params, 'track_key', None) )[next_way_point] )
 
 def is_higher_speed_favorable(params):
     """ no high difference in heading  """
@@ -157,4 +176,6 @@ def calculate_reward(params):
     return float(score_steer_to_point_ahead(params))
 
 def reward_function(params):
+    if step_params is not None:
+        params = step_params.as_step_params(params)
     return float(calculate_reward(params))
\ No newline at end of file
@@ -29,6 +29,12 @@ params = {
 import math
 import numpy as np
 from scipy import signal
+try:
+    # local tooling next to this file, missing when it is uploaded on its own
+    import track_cache
+    import step_params
+except ImportError:
+    track_cache = step_params = None
 
 def distance(p1, p2):
     """ Euclidean distance between two points """ 
@@ -57,6 +63,10 @@ def up_sample(waypoints, factor):
 
 def get_waypoints(params, scaling_factor):
     """ Way-points """
+    if step_params is not None:
+        # cached array per track and direction, sliced without copying
+        waypoints = step_params.get_waypoint_array(params['waypoints'], params['is_reversed'], getattr(params, 'track_key', None))
+        return waypoints[params["closest_waypoints"][1]: ]
     if params['is_reversed']: # driving clock wise.
         waypoints = list(reversed(params['waypoints']))
     else: # driving counter clock wise.
@@ -74,13 +84,26 @@ def target_angle(params):
     wp = get_waypoints(params, 2)
     return angle(wp[0], wp[1])    
 
-def is_a_turn_coming_up( params, n_points, angle_threshold ):
-    wp = get_waypoints(params, 2)
+def is_turn_within( wp, n_points, angle_threshold ):
     angles = [ angle( wp[i], wp[i+1] ) for i in range( min( n_points-1, len(wp)-1 ) ) ]
     angles = [ normalize_angle_to_360(angle) for angle in angles ]
     diff_angles = [ abs(angles[i] - angles[i+1]) for i in range(len(angles) - 1) ]
     return not all([ diff < angle_threshold for diff in diff_angles ])
 
+def get_turn_ahead_flags( waypoints, is_reversed, n_points, angle_threshold, key=None ):
+    """ is_turn_within for every possible next waypoint, computed once per track """
+    def compute(waypoints):
+        wp = list(reversed(waypoints)) if is_reversed else waypoints
+        return np.array([ is_turn_within( wp[i:], n_points, angle_threshold ) for i in range(len(wp)) ])
+    name = 'turn_ahead_%s_%s_%s' % (n_points, angle_threshold, int(is_reversed))
+    return track_cache.get_track_data(waypoints, name, compute, key=key)
+
+def is_a_turn_coming_up( params, n_points, angle_threshold ):
+    if track_cache is None:
+        return is_turn_within( get_waypoints(params, 2), n_points, angle_threshold )
+    flags = get_turn_ahead_flags( params['waypoints'], params['is_reversed'], n_points, angle_threshold, getattr(params, 'track_key', None) )
+    return bool( flags[params["closest_waypoints"][1]] )
+
 def is_higher_speed_favorable(params):
     """ no high difference in heading  """
     # speed range 2-4 > 0 - 6
@@ -145,4 +168,6 @@ def calculate_reward(params):
     return float(score_steer_to_point_ahead(params))
 
 def reward_function(params):
+    if step_params is not None:
+        params = step_params.as_step_params(params)
     return float(calculate_reward(params))
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Attributes the cost of reward_function calls to the helpers they run.
+
+While a wrapped reward_function runs, every python and builtin call below it is
+traced with sys.setprofile and its self time is charged to its call stack. Time
+is aggregated per episode (a new episode starts when params['steps'] does not
+increase) and written as a collapsed-stack file, one `frame;frame;frame usec`
+line per stack, which flamegraph.pl, speedscope and inferno read directly:
+
+    <out_dir>/episode_0001.folded
+
+Tracing every call slows the reward down several times, so the absolute numbers
+are inflated, but the split between helpers is what this is for.
+
+A profiled reward_function can be called from several threads, e.g. one per
+rollout worker: each thread keeps its own stacks and episode boundaries, and
+every file holds one episode of one thread. Files are numbered in the order
+episodes finish.
+
+Around a simulator or any other caller:
+
+    import reward_function, reward_profiler
+    reward_profiler.install(reward_function, 'profiles/')
+    ...
+    reward_profiler.uninstall(reward_function)
+
+Over a local replay of logged steps, one params JSON object per line:
+
+    python reward_profiler.py reward_function steps.jsonl --out-dir profiles/
+"""
+import argparse
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+def frame_name(frame):
+    code = frame.f_code
+    return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+def builtin_name(function):
+    module = getattr(function, '__module__', None) or type(getattr(function, '__self__', None)).__name__
+    return '%s:%s' % (module, getattr(function, '__qualname__', function.__name__))
+
+class ThreadProfile:
+    """ stacks of the current episode of one thread, and the reward call it is tracing """
+    __slots__ = ( 'stack', 'stacks', 'last_event', 'previous_steps' )
+
+    def __init__(self):
+        self.stack = []
+        self.stacks = collections.Counter()
+        self.last_event = 0
+        self.previous_steps = None
+
+class RewardProfiler:
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.episode = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles = []
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _thread_profile(self):
+        profile = getattr(self.local, 'profile', None)
+        if profile is None:
+            profile = self.local.profile = ThreadProfile()
+            with self.lock:
+                self.profiles.append(profile)
+        return profile
+
+    def _charge(self, profile, now):
+        if profile.stack:
+            profile.stacks[';'.join(profile.stack)] += now - profile.last_event
+        profile.last_event = now
+
+    def _trace(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        profile = self.local.profile
+        self._charge(profile, now)
+        if event == 'call':
+            profile.stack.append(frame_name(frame))
+        elif event == 'c_call':
+            profile.stack.append(builtin_name(arg))
+        elif profile.stack:
+            # 'return', 'c_return' and 'c_exception'
+            profile.stack.pop()
+        profile.last_event = time.perf_counter_ns()
+
+    def wrap(self, reward_function):
+        @functools.wraps(reward_function)
+        def profiled_reward_function(params):
+            profile = self._thread_profile()
+            steps = params.get('steps')
+            if profile.previous_steps is not None and steps is not None and steps <= profile.previous_steps:
+                self.write_episode(profile)
+            profile.previous_steps = steps
+            profile.stack = []
+            profile.last_event = time.perf_counter_ns()
+            sys.setprofile(self._trace)
+            try:
+                return reward_function(params)
+            finally:
+                sys.setprofile(None)
+                profile.stack = []
+        profiled_reward_function.profiler = self
+        return profiled_reward_function
+
+    def write_episode(self, profile):
+        """ writes the stacks a thread collected since its last episode boundary, in microseconds """
+        stacks, profile.stacks = profile.stacks, collections.Counter()
+        if not stacks:
+            return
+        with self.lock:
+            self.episode += 1
+            episode = self.episode
+        path = os.path.join(self.out_dir, 'episode_%04d.folded' % episode)
+        with open(path, 'w') as folded:
+            for stack, nanoseconds in sorted(stacks.items()):
+                if nanoseconds >= 1000:
+                    folded.write('%s %d\n' % (stack, nanoseconds // 1000))
+
+    def close(self):
+        """ writes the unfinished episode of every thread """
+        with self.lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            self.write_episode(profile)
+
+def install(module, out_dir):
+    """ replaces module.reward_function with a profiled version until uninstall(module) """
+    profiler = RewardProfiler(out_dir)
+    module._unprofiled_reward_function = module.reward_function
+    module.reward_function = profiler.wrap(module.reward_function)
+    return profiler
+
+def uninstall(module):
+    module.reward_function.profiler.close()
+    module.reward_function = module.__dict__.pop('_unprofiled_reward_function')
+
+def replay(module, steps_path, out_dir):
+    """ profiles the module over logged steps, one params JSON object per line """
+    profiler = RewardProfiler(out_dir)
+    reward_function = profiler.wrap(module.reward_function)
+    with open(steps_path) as steps:
+        for line in steps:
+            if line.strip():
+                reward_function(json.loads(line))
+    profiler.close()
+    return profiler.episode
+
+def main():
+    import batch_evaluator
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('module', choices=batch_evaluator.REWARD_MODULES)
+    parser.add_argument('steps', help='file with one params JSON object per line')
+    parser.add_argument('--out-dir', default='profiles')
+    args = parser.parse_args()
+    episodes = replay(batch_evaluator.load_module(args.module), args.steps, args.out_dir)
+    print('wrote %d episode profiles to %s' % (episodes, args.out_dir))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Local reward scoring service.
+
+Speaks newline delimited JSON over a unix socket or localhost TCP. Each request
+line is {"module": "<reward module>", "params": {...}} and gets back
+{"reward": float} or {"error": str} on its own line, in request order.
+
+Requests from all connections are micro-batched per module: the first request
+opens a window of `window_ms`, everything that arrives within it (up to
+`max_batch`) goes to batch_evaluator.evaluate in one call on a worker thread.
+If the batch fails, its steps are scored one by one so only the bad requests get
+an error. Queues are bounded by `max_pending`; a connection reads its next line
+only once the previous request is queued, so when a module queue is full the
+server stops reading from the connections feeding it and overload pushes back
+on the clients instead of growing memory.
+
+    python reward_server.py --unix /tmp/reward.sock
+    python reward_server.py --port 8765 --window-ms 5 --max-batch 512
+"""
+import argparse
+import asyncio
+import json
+
+import batch_evaluator
+
+def error_reply(error):
+    return {'error': '%s: %s' % (type(error).__name__, error)}
+
+async def get_reply(future):
+    try:
+        return {'reward': await future}
+    except Exception as error:
+        return error_reply(error)
+
+class RewardServer:
+    def __init__(self, window_ms=2.0, max_batch=256, max_pending=4096):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.queues = {}
+        self.batchers = []
+
+    def get_queue(self, module_name):
+        queue = self.queues.get(module_name)
+        if queue is None:
+            batch_evaluator.load_module(module_name)
+            queue = self.queues[module_name] = asyncio.Queue(self.max_pending)
+            self.batchers.append(asyncio.create_task(self.run_batcher(module_name, queue)))
+        return queue
+
+    async def submit(self, module_name, params):
+        """ queues a step, waiting while the module queue is full, and returns the future of its reward """
+        future = asyncio.get_running_loop().create_future()
+        await self.get_queue(module_name).put((params, future))
+        return future
+
+    async def score(self, module_name, params):
+        return await (await self.submit(module_name, params))
+
+    async def run_batcher(self, module_name, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            params_list = [params for params, _ in batch]
+            try:
+                rewards = await loop.run_in_executor(None, batch_evaluator.evaluate, module_name, params_list)
+            except Exception:
+                # one bad step fails the whole batch, rescore one by one so only it gets the error
+                rewards = await loop.run_in_executor(None, batch_evaluator.evaluate_each, module_name, params_list)
+            for (_, future), reward in zip(batch, rewards):
+                if future.done():
+                    continue
+                if isinstance(reward, Exception):
+                    future.set_exception(reward)
+                else:
+                    future.set_result(reward)
+
+    async def handle_request(self, line):
+        """ queues a request line, waiting while its module queue is full, and returns the future of its reply """
+        try:
+            request = json.loads(line)
+            future = await self.submit(request['module'], request['params'])
+        except Exception as error:
+            reply = asyncio.get_running_loop().create_future()
+            reply.set_result(error_reply(error))
+            return reply
+        return asyncio.ensure_future(get_reply(future))
+
+    async def handle_connection(self, reader, writer):
+        # replies are written in request order while later requests are already queued
+        replies = asyncio.Queue(self.max_pending)
+
+        async def read_requests():
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    # waits here while the module queue is full, so nothing more is read from this client
+                    await replies.put(await self.handle_request(line))
+            await replies.put(None)
+
+        async def write_replies():
+            while True:
+                reply = await replies.get()
+                if reply is None:
+                    break
+                writer.write(json.dumps(await reply).encode() + b'\n')
+                await writer.drain()
+
+        # a reset on either side ends both, the reader would otherwise wait forever on a full reply queue
+        tasks = [ asyncio.create_task(read_requests()), asyncio.create_task(write_replies()) ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, ConnectionError):
+                raise result
+
+    async def serve(self, unix_path=None, host='127.0.0.1', port=8765):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--unix', help='unix socket path, TCP is used when omitted')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window-ms', type=float, default=2.0, help='micro-batching window')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-pending', type=int, default=4096, help='queued requests per module before pushing back')
+    args = parser.parse_args()
+    server = RewardServer(args.window_ms, args.max_batch, args.max_pending)
+    asyncio.run(server.serve(args.unix, args.host, args.port))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Slotted representation of the simulator params for the reward hot path.
+
+StepParams.from_dict converts the params dict once per step. Besides the fields
+of the dict it carries the track key, so helpers that look up per-track
+precomputes skip hashing the waypoints on each call. get_waypoint_array gives
+the waypoints as one read-only float64 array per track and driving direction,
+so helpers slice a view instead of copying (and reversing) the list every step. The key is found by
+identity when the simulator hands over the same waypoints list again and by a
+tuple lookup otherwise, both much cheaper than track_cache.track_key.
+
+params['x'] keeps working on a StepParams, so the reward modules accept either
+form. reward_function and reward_function_vk convert on entry, `python
+step_params.py` compares their per-step cost with and without the conversion.
+"""
+import threading
+
+import numpy as np
+
+import track_cache
+
+FIELDS = (
+    'all_wheels_on_track', 'x', 'y', 'closest_objects', 'closest_waypoints', 'distance_from_center',
+    'is_crashed', 'is_left_of_center', 'is_offtrack', 'is_reversed', 'heading', 'objects_distance',
+    'objects_heading', 'objects_left_of_center', 'objects_location', 'objects_speed', 'progress',
+    'speed', 'steering_angle', 'steps', 'track_length', 'track_width', 'waypoints',
+)
+MAX_TRACK_KEYS = 16
+
+_lock = threading.Lock()
+_last_track = (None, None)
+_keys_by_waypoints = {}
+
+def get_track_key(waypoints):
+    """ track_cache.track_key, memoized on the waypoints list """
+    global _last_track
+    last_waypoints, last_key = _last_track
+    if waypoints is last_waypoints:
+        return last_key
+    lookup = tuple(waypoints)
+    try:
+        key = _keys_by_waypoints.get(lookup)
+    except TypeError:
+        # rows are lists or arrays, not hashable
+        lookup = tuple(map(tuple, waypoints))
+        key = _keys_by_waypoints.get(lookup)
+    if key is None:
+        key = track_cache.track_key(waypoints)
+        with _lock:
+            if len(_keys_by_waypoints) >= MAX_TRACK_KEYS:
+                _keys_by_waypoints.clear()
+            _keys_by_waypoints[lookup] = key
+    _last_track = (waypoints, key)
+    return key
+
+def get_waypoint_array(waypoints, is_reversed=False, key=None):
+    """ the waypoints in driving order as a read-only float64 array, built once per track and direction """
+    def compute(wp):
+        array = np.array(wp, dtype=np.float64)
+        return array[::-1].copy() if is_reversed else array
+    return track_cache.get_track_data(waypoints, 'waypoint_array_%d' % bool(is_reversed), compute, key=key or get_track_key(waypoints))
+
+class StepParams:
+    __slots__ = FIELDS + ( 'track_key', )
+
+    def __getitem__(self, name):
+        # missing fields raise KeyError like the params dict
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    @classmethod
+    def from_dict(cls, params):
+        step = cls()
+        for name in FIELDS:
+            if name in params:
+                setattr(step, name, params[name])
+        step.track_key = get_track_key(params['waypoints'])
+        return step
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self):
+        return { name: getattr(self, name) for name in FIELDS if hasattr(self, name) }
+
+def as_step_params(params):
+    """ params as StepParams, converting a simulator dict """
+    if isinstance(params, StepParams):
+        return params
+    return StepParams.from_dict(params)
+
+def benchmark(number=2000):
+    """
+    Microseconds per step of the reward modules that convert their params.
+    :return: {module name: (helpers called with the dict, reward_function including conversion, conversion alone)}
+    """
+    import contextlib
+    import io
+    import timeit
+    import batch_evaluator
+    with contextlib.redirect_stdout(io.StringIO()):
+        import test_case
+    params = test_case.get_test_params(0.45, 2.0, 3.0, 0.7)
+    # the simulator builds a new waypoints list every step, so the identity shortcut is not measured
+    new_step = lambda: dict(params, waypoints=list(params['waypoints']))
+    results = {}
+    for module_name in ( 'reward_function', 'reward_function_vk' ):
+        module = batch_evaluator.load_module(module_name)
+        module.reward_function(params)
+        with_dict = timeit.timeit(lambda: module.calculate_reward(new_step()), number=number)
+        converted = timeit.timeit(lambda: module.reward_function(new_step()), number=number)
+        conversion = timeit.timeit(lambda: StepParams.from_dict(new_step()), number=number)
+        results[module_name] = tuple(seconds / number * 1e6 for seconds in (with_dict, converted, conversion))
+    return results
+
+if __name__ == '__main__':
+    # run through the importable module, reward modules check isinstance against step_params.StepParams
+    from step_params import benchmark
+    print('%-24s %10s %12s %12s' % ('module', 'dict', 'converted', 'conversion'))
+    for module_name, timings in benchmark().items():
+        print('%-24s %8.1fus %10.1fus %10.1fus' % ((module_name,) + timings))
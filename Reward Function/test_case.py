@@ -1,5 +1,15 @@
 # MUDR21-MODEL-4
 import math
+try:
+	# local tooling next to this file, missing when it is uploaded on its own
+	import progress_tracker
+except ImportError:
+	progress_tracker = None
+try:
+	import step_params
+	import track_geometry
+except ImportError:
+	step_params = track_geometry = None
 # Going fast parameters
 FUTURE_STEP = 7
 TURN_THRESHOLD_ANGLE = 12    
@@ -19,12 +29,11 @@ STEEP_TURNING_ANGLE_THRESHOLD = 75
 ACUTE_TURNING_ANGLE_THRESHOLD = 75
 MEDIUM_TURNING_ANGLE_THRESHOLD = 45
 LESS_TURNING_ANGLE_THRESHOLD = 25
-previous_speed = 0
-previous_progress=0
-previous_progress_gain = 0
 WAYPOINTS_BEFORE=2
 WAYPOINTS_AFTER=3
 TOTAL_NUM_STEPS=230
+# only used without progress_tracker
+previous_progress=0
 def reward_function(params):
 	# Read input parameters
 	track_width = params['track_width']
@@ -47,9 +56,14 @@ def reward_function(params):
 	track_direction = get_track_direction(waypoints,closest_waypoints)
 	future_track_direction = get_future_track_direction(waypoints,closest_waypoints,FUTURE_STEP)
 	#direction_diff = get_direction_diff(track_direction,heading)
-	global previous_progress
-	global previous_progress_gain
-	global previous_speed
+	if progress_tracker is not None:
+		progress_gain = progress_tracker.update(params).progress_gain
+	else:
+		global previous_progress
+		progress_gain = progress - previous_progress
+		previous_progress = progress
+	# hash the waypoints once per step for both chord lookups
+	track_key = step_params.get_track_key(waypoints) if step_params is not None else None
 	#Calculate 5 markers that are at varying distances away from the center line
 	marker_1 = 0.1 * track_width
 	marker_2 = 0.15 * track_width
@@ -66,15 +80,14 @@ def reward_function(params):
 	normalised_steering_angle = float(abs(steering_angle)/180)
 	normalised_speed = float(speed/4.0)
 
-	shortest_line_length, shortest_line_direction = get_shortest_straight_line_length_and_direction(waypoints,closest_waypoints)
-	distance_from_shortest_line = get_distance_from_shortest_straight_line(waypoints,closest_waypoints,car_position)
+	shortest_line_length, shortest_line_direction = get_shortest_straight_line_length_and_direction(waypoints,closest_waypoints,track_key)
+	distance_from_shortest_line = get_distance_from_shortest_straight_line(waypoints,closest_waypoints,car_position,track_key)
 	direction_diff = get_direction_diff(shortest_line_direction,heading)
 	#track_direction_diff = get_direction_diff(track_direction,future_track_direction)
 	track_direction_diff = get_direction_diff(shortest_line_direction,track_direction)
 	normalised_direction_diff = (direction_diff/180)
 	normalised_distance = (distance_from_shortest_line/track_width)/2
 	is_road_straight = is_straight_road_ahead(track_direction,future_track_direction)
-	progress_gain = progress - previous_progress
 	print("shortest line direction:" + str(shortest_line_direction) + " future direction:" + str(future_track_direction))
 	print(" direction diff with future is:",track_direction_diff)
 	print("heading and direction diff is:",direction_diff)
@@ -151,11 +164,6 @@ def reward_function(params):
 	print(f"steps_reward: {steps_reward} {progress_reward}")
 	
 
-	previous_progress_gain = progress_gain
-	previous_progress = progress
-	previous_speed = speed
-
-
 	if is_offtrack:
 		reward = 0.001
 	
@@ -293,12 +301,17 @@ def is_straight_road_ahead(direction, future_direction):
 
 
 
-def get_shortest_straight_line_length_and_direction(waypoints,closest_waypoints):
-	
-	waypoints_n_units_back, waypoints_n_units_forward = get_waypoint_n_units_further(waypoints,closest_waypoints,WAYPOINTS_BEFORE,WAYPOINTS_AFTER)
-	length = abs(math.sqrt((waypoints_n_units_forward[0]-waypoints_n_units_back[0])**2 + (waypoints_n_units_forward[1]-waypoints_n_units_back[1])**2))
-	direction = get_direction_between_two_waypoints(waypoints_n_units_back,waypoints_n_units_forward)
-	return length, direction
+def get_shortest_straight_line_length_and_direction(waypoints,closest_waypoints,track_key=None):
+	if track_geometry is None:
+		waypoints_n_units_back, waypoints_n_units_forward = get_waypoint_n_units_further(waypoints,closest_waypoints,WAYPOINTS_BEFORE,WAYPOINTS_AFTER)
+		length = abs(math.sqrt((waypoints_n_units_forward[0]-waypoints_n_units_back[0])**2 + (waypoints_n_units_forward[1]-waypoints_n_units_back[1])**2))
+		direction = get_direction_between_two_waypoints(waypoints_n_units_back,waypoints_n_units_forward)
+		return length, direction
+	# the back/forward chord of every waypoint is precomputed once per track
+	chords = track_geometry.get_chords(waypoints,WAYPOINTS_BEFORE,WAYPOINTS_AFTER,key=track_key)
+	prev_waypoint = closest_waypoints[0]
+	print("back waypoint:" + str(chords.back_index[prev_waypoint]) + " forward wapoint:" + str(chords.forward_index[prev_waypoint]))
+	return float(chords.length[prev_waypoint]), float(chords.direction[prev_waypoint])
 
 def get_waypoint_n_units_further(waypoints,closest_waypoints,WAYPOINTS_BEFORE,WAYPOINTS_AFTER):
 	prev_waypoint = closest_waypoints[0]
@@ -325,19 +338,19 @@ def get_waypoint_index_n_units_back(current_waypoint_index,n_units,waypoints):
 		waypoints_n_units_back_index = len(waypoints) + waypoints_n_units_back_index
 	return waypoints_n_units_back_index
 
-def get_distance_from_shortest_straight_line(waypoints,closest_waypoints, car_position):
-	waypoint_n_units_back, waypoint_n_units_forward = get_waypoint_n_units_further(waypoints,closest_waypoints,WAYPOINTS_BEFORE,WAYPOINTS_AFTER)
-	x1 = waypoint_n_units_back[0]
-	y1 = waypoint_n_units_back[1]
-	#print("first waypoint is ", first_waypoint)
-	#print("last waypoint is ", last_waypoint)
-	x2 = waypoint_n_units_forward[0]
-	y2 = waypoint_n_units_forward[1]
-	# co-ordinates from car
-	x = car_position[0]
-	y = car_position[1]
-	distance = abs((x2-x1)*(y1-y) - (x1-x)*(y2-y1)) / abs(math.sqrt((x2-x1)**2 + (y2-y1)**2))
-	return distance
+def get_distance_from_shortest_straight_line(waypoints,closest_waypoints, car_position,track_key=None):
+	if track_geometry is None:
+		waypoint_n_units_back, waypoint_n_units_forward = get_waypoint_n_units_further(waypoints,closest_waypoints,WAYPOINTS_BEFORE,WAYPOINTS_AFTER)
+		x1 = waypoint_n_units_back[0]
+		y1 = waypoint_n_units_back[1]
+		x2 = waypoint_n_units_forward[0]
+		y2 = waypoint_n_units_forward[1]
+		# co-ordinates from car
+		x = car_position[0]
+		y = car_position[1]
+		return abs((x2-x1)*(y1-y) - (x1-x)*(y2-y1)) / abs(math.sqrt((x2-x1)**2 + (y2-y1)**2))
+	chords = track_geometry.get_chords(waypoints,WAYPOINTS_BEFORE,WAYPOINTS_AFTER,key=track_key)
+	return float(track_geometry.distance_to_chord(chords,closest_waypoints[0],car_position[0],car_position[1]))
 
 def get_test_params(heading,speed,x,y):
 	return {
@@ -0,0 +1,166 @@
+"""
+Per-track precomputes, optionally persisted on disk.
+
+By default artifacts are computed in memory once per process. When the
+TRACK_ARTIFACT_DIR environment variable is set (or an artifact_dir is passed)
+they are saved to <dir>/<track key>/v<ALGORITHM_VERSION>/<name>.npy and loaded
+with np.load(mmap_mode='r'), so a cold worker pays a file open for the first
+step of an episode instead of a geometry pass, and processes on the same
+machine share the pages. Nothing is written to disk unless asked, the simulator
+included. Bump ALGORITHM_VERSION whenever compute_artifacts changes; artifacts
+of other versions are ignored and pruned on the next save.
+
+The track is a closed loop. The center line usually ends with a copy of its
+first point, which is dropped for the geometry; every per-waypoint artifact has
+one entry per waypoint, with the closing point repeating the first.
+
+    turn_flags       bool per waypoint, True where reward_function.get_turn_points marks a turn point
+    heading          degrees of the segment from waypoint i to the next one
+    heading_change   signed heading change at waypoint i, from the segment into it to the segment out of it, wrapped to [-180, 180)
+    heading_prefix   cumulative heading change, prefix[j] - prefix[i] is the turning after i up to and including j
+    curvature        1/radius of the circle through waypoints i-1, i, i+1
+    speed_profile    target speed per waypoint from the lateral acceleration limit
+    resampled_line   loop resampled to RESAMPLE_FACTOR times as many points, without a closing point
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy import signal
+
+import track_cache
+
+ALGORITHM_VERSION = 2
+# unset: artifacts are kept in memory only
+ARTIFACT_DIR = os.environ.get('TRACK_ARTIFACT_DIR')
+
+TURN_WINDOW_SIZE = 8
+TURN_THRESHOLD_ANGLE = 4.5
+MAX_SPEED = 4.0
+MIN_SPEED = 1.0
+MAX_LATERAL_ACCELERATION = 2.5
+RESAMPLE_FACTOR = 2
+
+ARTIFACT_NAMES = ( 'turn_flags', 'heading', 'heading_change', 'heading_prefix', 'curvature', 'speed_profile', 'resampled_line' )
+
+def get_turn_flags(points, window_size=TURN_WINDOW_SIZE, threshold_angle=TURN_THRESHOLD_ANGLE):
+    """ vectorized reward_function.get_turn_points, as a flag per waypoint """
+    flags = np.zeros(len(points), dtype=bool)
+    if len(points) < window_size:
+        return flags
+    p1, p2, p3 = points[:-2], points[1:-1], points[2:]
+    angles = np.degrees(
+        np.arctan2(p3[:, 1] - p2[:, 1], p3[:, 0] - p2[:, 0]) - np.arctan2(p1[:, 1] - p2[:, 1], p1[:, 0] - p2[:, 0])
+    ) % 360
+    windows = np.lib.stride_tricks.sliding_window_view(angles, window_size - 2)
+    flags[:len(windows)] = np.abs(windows.max(axis=1) - windows.min(axis=1)) >= threshold_angle
+    return flags
+
+def get_loop(points):
+    """ points of the closed loop, without a closing point that repeats the first """
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        return points[:-1]
+    return points
+
+def close_loop(values, n):
+    """ per loop point values back to n waypoints, the closing point gets the value of the first """
+    return np.concatenate([values, values[:n - len(values)]])
+
+def get_curvature(points):
+    """ Menger curvature, the track is treated as a closed loop """
+    n, points = len(points), get_loop(points)
+    prev_points, next_points = np.roll(points, 1, axis=0), np.roll(points, -1, axis=0)
+    a = np.linalg.norm(points - prev_points, axis=1)
+    b = np.linalg.norm(next_points - points, axis=1)
+    c = np.linalg.norm(next_points - prev_points, axis=1)
+    cross = (points[:, 0] - prev_points[:, 0]) * (next_points[:, 1] - prev_points[:, 1]) \
+          - (points[:, 1] - prev_points[:, 1]) * (next_points[:, 0] - prev_points[:, 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        curvature = 2 * np.abs(cross) / (a * b * c)
+    return close_loop(np.nan_to_num(curvature, nan=0.0, posinf=0.0), n)
+
+def compute_artifacts(waypoints):
+    points = np.asarray(waypoints, dtype=np.float64)[:, :2]
+    loop = get_loop(points)
+    segments = np.roll(loop, -1, axis=0) - loop
+    heading = np.degrees(np.arctan2(segments[:, 1], segments[:, 0]))
+    heading_change = close_loop((heading - np.roll(heading, 1) + 180) % 360 - 180, len(points))
+    heading = close_loop(heading, len(points))
+    curvature = get_curvature(points)
+    with np.errstate(divide='ignore'):
+        speed_profile = np.clip(np.sqrt(MAX_LATERAL_ACCELERATION / curvature), MIN_SPEED, MAX_SPEED)
+    return {
+        'turn_flags': get_turn_flags(points),
+        'heading': heading,
+        'heading_change': heading_change,
+        'heading_prefix': np.cumsum(heading_change),
+        'curvature': curvature,
+        'speed_profile': speed_profile,
+        'resampled_line': signal.resample(loop, len(loop) * RESAMPLE_FACTOR),
+    }
+
+def artifact_path(key, artifact_dir):
+    return os.path.join(artifact_dir, key, 'v%d' % ALGORITHM_VERSION)
+
+def load_artifacts(key, artifact_dir):
+    """ memory mapped artifacts of the current version, None when missing """
+    path = artifact_path(key, artifact_dir)
+    try:
+        return { name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ARTIFACT_NAMES }
+    except (OSError, ValueError, EOFError):
+        # missing, or a truncated / corrupt file
+        return None
+
+def save_artifacts(key, artifacts, artifact_dir):
+    """ writes artifacts atomically and removes artifacts of other versions """
+    path = artifact_path(key, artifact_dir)
+    track_dir = os.path.dirname(path)
+    os.makedirs(track_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=track_dir, prefix='.staging-')
+    try:
+        for name in ARTIFACT_NAMES:
+            np.save(os.path.join(staging, name + '.npy'), artifacts[name])
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # another worker saved the same version first, or an unreadable save is in the way
+            if load_artifacts(key, artifact_dir) is None:
+                shutil.rmtree(path, ignore_errors=True)
+                try:
+                    os.rename(staging, path)
+                except OSError:
+                    pass
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    for entry in os.listdir(track_dir):
+        if entry != os.path.basename(path) and not entry.startswith('.staging-'):
+            shutil.rmtree(os.path.join(track_dir, entry), ignore_errors=True)
+
+def load_or_compute(waypoints, key=None, artifact_dir=None):
+    """ artifacts of the track, through the artifact directory when there is one """
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    if not artifact_dir:
+        return compute_artifacts(waypoints)
+    key = key or track_cache.track_key(waypoints)
+    artifacts = load_artifacts(key, artifact_dir)
+    if artifacts is None:
+        artifacts = compute_artifacts(waypoints)
+        try:
+            save_artifacts(key, artifacts, artifact_dir)
+        except OSError:
+            # read-only or full disk, keep the in-memory copy
+            return artifacts
+        artifacts = load_artifacts(key, artifact_dir) or artifacts
+    return artifacts
+
+def get_artifacts(waypoints, key=None):
+    """
+    Artifacts of the track, each one a read-only array cached (and shared between processes) through track_cache.
+    :return: dict of artifact name -> array, a new dict on every call
+    """
+    prefix = 'artifact_v%d_' % ALGORITHM_VERSION
+    arrays = track_cache.get_track_arrays(
+        waypoints, [ prefix + name for name in ARTIFACT_NAMES ],
+        lambda wp: { prefix + name: array for name, array in load_or_compute(wp, key).items() }, key=key)
+    return { name: arrays[prefix + name] for name in ARTIFACT_NAMES }
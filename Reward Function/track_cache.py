@@ -0,0 +1,246 @@
+"""
+Process wide cache for per-track precomputes.
+
+Reward helpers call get_track_data(waypoints, name, compute) instead of
+recomputing geometry from params['waypoints'] on every step. Entries are keyed
+by a stable hash of the waypoints, so every worker thread that sees the same
+track gets the same object back, and concurrent first requests for a key wait
+on a single computation instead of each running their own. Values computed
+together, such as the track artifacts, go through get_track_arrays so each one
+is still its own entry.
+
+Array entries are stored read-only and can be shared between processes: each
+array entry lives in its own multiprocessing.shared_memory block. A process
+that misses an entry first looks for its block and only computes when there is
+none. Blocks are created by a process that called set_publishing(True) before
+warming the cache (every array it computes is published), or by publish_track()
+for the entries it already holds. The publisher owns its blocks and unlinks
+them with release_track(key, unlink=True) or clear(unlink=True).
+
+    track_cache.set_publishing(True)
+    reward_function.reward_function(params)   # computes and publishes the entries of the track
+    # start the workers, their first miss on each entry attaches to the block
+"""
+import hashlib
+import json
+import struct
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# short, macOS allows 31 characters per block name
+SHARED_MEMORY_PREFIX = "tb_"
+_HEADER_SIZE = struct.calcsize("<Q")
+_DATA_ALIGNMENT = 64
+
+_lock = threading.Lock()
+_entries = {}
+_pending = {}
+_blocks = {}
+_published = set()
+_publishing = False
+
+def track_key(waypoints):
+    """ Stable hash of the track, identical across threads and processes """
+    data = np.ascontiguousarray(waypoints, dtype=np.float64)
+    return hashlib.sha1(data.tobytes()).hexdigest()[:16]
+
+def set_publishing(enabled=True):
+    """ Publishes every array entry this process computes from now on, for other processes to attach to """
+    global _publishing
+    _publishing = enabled
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    return value
+
+def get_track_data(waypoints, name, compute, key=None):
+    """
+    Returns the cached value of `name` for the track, computing it once.
+    :param waypoints: track waypoints, as given in params['waypoints']
+    :param name: name of the precompute, e.g. 'turn_points'
+    :param compute: callable taking the waypoints and returning the value
+    :param key: track key if the caller already has it
+    :return: the cached value, arrays are read-only
+    """
+    key = key or track_key(waypoints)
+    entry = (key, name)
+    while True:
+        with _lock:
+            if entry in _entries:
+                return _entries[entry]
+            event = _pending.get(entry)
+            if event is None:
+                event = _pending[entry] = threading.Event()
+                break
+        # someone else is computing this entry, wait for them and look again
+        event.wait()
+
+    try:
+        with _lock:
+            if entry in _entries:
+                return _entries[entry]
+        value = _attach(key, name)
+        if value is None:
+            value = _freeze(compute(waypoints))
+            if _publishing and isinstance(value, np.ndarray):
+                # keep the shared copy so the publisher does not hold the data twice
+                value = _publish(key, name, value)
+        with _lock:
+            _entries[entry] = value
+        return value
+    finally:
+        with _lock:
+            del _pending[entry]
+        event.set()
+
+def get_track_arrays(waypoints, names, compute, key=None):
+    """
+    Cached values of entries that are computed together, each one cached (and shared) as its own entry.
+    :param names: entry names
+    :param compute: callable taking the waypoints and returning a dict with a value for every name
+    :return: dict of name -> cached value
+    """
+    key = key or track_key(waypoints)
+    computed = {}
+
+    def compute_entry(name):
+        def compute_one(wp):
+            # the first missing entry computes the whole group, the others take theirs from it
+            if not computed:
+                computed.update(compute(wp))
+            return computed[name]
+        return compute_one
+
+    return { name: get_track_data(waypoints, name, compute_entry(name), key=key) for name in names }
+
+def _shared_name(key, name):
+    return '%s%s_%s' % (SHARED_MEMORY_PREFIX, key, hashlib.sha1(name.encode()).hexdigest()[:8])
+
+def _publish(key, name, array):
+    """ copies an array entry into its shared block, returns the shared view (another process's when it published first) """
+    header = json.dumps([array.dtype.str, list(array.shape)]).encode()
+    data_start = -(-(_HEADER_SIZE + len(header)) // _DATA_ALIGNMENT) * _DATA_ALIGNMENT
+    size = max(data_start + array.nbytes, 1)
+    try:
+        shm = shared_memory.SharedMemory(name=_shared_name(key, name), create=True, size=size)
+    except FileExistsError:
+        existing = _attach(key, name)
+        if existing is not None:
+            # published by another process first, use theirs
+            return existing
+        # left unreadable by a publisher that died while writing it
+        _unlink(_shared_name(key, name))
+        try:
+            shm = shared_memory.SharedMemory(name=_shared_name(key, name), create=True, size=size)
+        except FileExistsError:
+            return array
+    # data first and the header length last, a reader that sees the length sees complete data
+    shm.buf[data_start:data_start + array.nbytes] = np.ascontiguousarray(array).tobytes()
+    shm.buf[_HEADER_SIZE:_HEADER_SIZE + len(header)] = header
+    shm.buf[:_HEADER_SIZE] = struct.pack("<Q", len(header))
+    with _lock:
+        _blocks[(key, name)] = shm
+        _published.add((key, name))
+    return _freeze(np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=data_start))
+
+def publish_track(waypoints=None, key=None):
+    """
+    Copies the cached array entries of a track into shared memory so other
+    processes can attach to them. Call it from the process that warmed the cache.
+    :return: names of the shared memory blocks created
+    """
+    key = key or track_key(waypoints)
+    with _lock:
+        arrays = { name: value for (k, name), value in _entries.items()
+                   if k == key and isinstance(value, np.ndarray) and (k, name) not in _blocks }
+    created = []
+    for name, array in arrays.items():
+        shared = _publish(key, name, array)
+        if shared is not array:
+            with _lock:
+                _entries[(key, name)] = shared
+            created.append(_shared_name(key, name))
+    return created
+
+def _open_untracked(name):
+    """
+    Opens an existing block without registering it with the resource tracker.
+    The block belongs to its publisher: a registration here would unlink it when
+    this process exits, and unregistering afterwards would drop the publisher's
+    own registration when both share a tracker.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 has no track argument
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _unlink(block_name):
+    try:
+        # tracked, unlink() unregisters it again
+        stale = shared_memory.SharedMemory(name=block_name)
+    except FileNotFoundError:
+        return
+    stale.close()
+    stale.unlink()
+
+def _close(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # arrays handed out earlier still view the block, the mapping goes away with them
+        pass
+
+def _attach(key, name):
+    """ the published array of an entry, None when no process published it (yet) """
+    try:
+        shm = _open_untracked(_shared_name(key, name))
+    except FileNotFoundError:
+        return None
+    try:
+        header_length, = struct.unpack("<Q", bytes(shm.buf[:_HEADER_SIZE]))
+        if not header_length:
+            raise ValueError('block is still being written')
+        dtype, shape = json.loads(bytes(shm.buf[_HEADER_SIZE:_HEADER_SIZE + header_length]).decode())
+        data_start = -(-(_HEADER_SIZE + header_length) // _DATA_ALIGNMENT) * _DATA_ALIGNMENT
+        array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=data_start)
+    except (struct.error, ValueError, TypeError):
+        # unfinished or broken block, compute locally
+        _close(shm)
+        return None
+    with _lock:
+        _blocks[(key, name)] = shm
+    return _freeze(array)
+
+def track_nbytes(key):
+    """ bytes held by the cached array entries of a track """
+    with _lock:
+        return sum(value.nbytes for (k, _), value in _entries.items() if k == key and isinstance(value, np.ndarray))
+
+def release_track(key, unlink=False):
+    """ Drops the cached entries of a track and detaches from its shared blocks, unlink only applies to blocks this process published """
+    with _lock:
+        for entry in [entry for entry in _entries if entry[0] == key]:
+            del _entries[entry]
+        blocks = [ (entry, _blocks.pop(entry)) for entry in list(_blocks) if entry[0] == key ]
+        published = { entry for entry, _ in blocks if entry in _published }
+        _published.difference_update(published)
+    for entry, shm in blocks:
+        # only the publisher unlinks, attached blocks are not registered with our tracker
+        if unlink and entry in published:
+            shm.unlink()
+        _close(shm)
+
+def clear(unlink=False):
+    """ Empties the cache of this process, shared blocks are left to their owners unless unlink and published here """
+    for key in { key for key, _ in list(_blocks) + list(_entries) }:
+        release_track(key, unlink)
@@ -0,0 +1,64 @@
+"""
+Precomputed chord geometry of test_case's shortest straight line.
+
+test_case steers along the chord from the waypoint `before` waypoints behind the
+previous waypoint to the one `after` waypoints ahead of it. get_chords computes
+the chord of every waypoint index once per track, so a step is a table lookup
+plus a point-to-line distance, and distance_to_chord does the distance for whole
+batches of logged positions when re-scoring offline.
+"""
+import collections
+
+import numpy as np
+
+import track_cache
+
+Chords = collections.namedtuple('Chords', [ 'back_index', 'forward_index', 'back', 'forward', 'length', 'direction' ])
+
+def compute_chords(waypoints, before, after):
+    points = np.asarray(waypoints, dtype=np.float64)[:, :2]
+    index = np.arange(len(points))
+    # same wrap as test_case.get_waypoint_index_n_units_back / _ahead
+    back_index = (index - before) % len(points)
+    forward_index = (index + after) % len(points)
+    back, forward = points[back_index], points[forward_index]
+    delta = forward - back
+    chords = Chords(
+        back_index=back_index,
+        forward_index=forward_index,
+        back=back,
+        forward=forward,
+        length=np.hypot(delta[:, 0], delta[:, 1]),
+        direction=np.degrees(np.arctan2(delta[:, 1], delta[:, 0])),
+    )
+    for array in chords:
+        array.setflags(write=False)
+    return chords
+
+def get_chords(waypoints, before, after, key=None):
+    """
+    Chords of every waypoint index, computed once per track.
+    :param before: waypoints behind the previous waypoint, test_case.WAYPOINTS_BEFORE
+    :param after: waypoints ahead of the previous waypoint, test_case.WAYPOINTS_AFTER
+    """
+    name = 'chords_%d_%d' % (before, after)
+    names = [ '%s_%s' % (name, field) for field in Chords._fields ]
+
+    def compute(wp):
+        # every field is its own array entry so processes can share it, the namedtuple is a per-process view
+        arrays = track_cache.get_track_arrays(
+            wp, names, lambda wp: dict(zip(names, compute_chords(wp, before, after))), key=key)
+        return Chords(*[ arrays[field_name] for field_name in names ])
+
+    return track_cache.get_track_data(waypoints, name, compute, key=key)
+
+def distance_to_chord(chords, index, x, y):
+    """
+    Distance of positions from the chords of the given previous waypoint indexes.
+    Works on scalars and on arrays of any shape alike.
+    """
+    index = np.asarray(index)
+    x1, y1 = chords.back[index, 0], chords.back[index, 1]
+    x2, y2 = chords.forward[index, 0], chords.forward[index, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs((x2 - x1) * (y1 - y) - (x1 - x) * (y2 - y1)) / chords.length[index]
@@ -0,0 +1,85 @@
+"""
+Track and trajectory plots for deepracer_analysis.ipynb that stay fast on whole training runs.
+
+Every function draws a fixed, small number of artists whatever the amount of
+data: turn points come from the track artifacts as one scatter, positions are
+binned into a density image instead of a scatter per point, and trajectories
+are decimated and drawn as a single LineCollection.
+
+    track = track_plots.load_track('tracks/ace_speedway_2022_april_open_cw.npy')
+    columns = episode_store.load_columns('runs/run_1', ['episode', 'x', 'y'])
+    fig, ax = plt.subplots(figsize=(12, 8))
+    track_plots.plot_density(ax, columns['x'], columns['y'], track)
+    track_plots.plot_track(ax, track)
+"""
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
+
+import episode_store
+import track_artifacts
+from lap_estimator import load_track
+
+def get_extent(track, margin=0.5):
+    borders = np.vstack(track)
+    (x_min, y_min), (x_max, y_max) = borders.min(axis=0) - margin, borders.max(axis=0) + margin
+    return x_min, x_max, y_min, y_max
+
+def plot_track(ax, track, turn_points=True):
+    """ borders, center line and the turn points of the track artifacts """
+    center_line, inner_border, outer_border = track
+    ax.plot(center_line[:, 0], center_line[:, 1], c='r', lw=0.8, ls='--', label='center_line')
+    ax.plot(inner_border[:, 0], inner_border[:, 1], c='b', lw=1, label='inner_border')
+    ax.plot(outer_border[:, 0], outer_border[:, 1], c='b', lw=1, label='outer_border')
+    if turn_points:
+        turn_flags = np.asarray(track_artifacts.get_artifacts(center_line)['turn_flags'])
+        ax.scatter(center_line[turn_flags, 0], center_line[turn_flags, 1], s=10, c='k', label='turn_points', zorder=3)
+    ax.set_aspect('equal')
+    return ax
+
+def plot_density(ax, x, y, track=None, bins=300, cmap='inferno', values=None):
+    """
+    Heat-map of positions binned on a bins x bins grid.
+    :param values: optional per-step values (e.g. speed, reward), the mean per bin is shown instead of the count
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if track is not None:
+        x_min, x_max, y_min, y_max = get_extent(track)
+    else:
+        x_min, x_max, y_min, y_max = x.min(), x.max(), y.min(), y.max()
+    grid = [[x_min, x_max], [y_min, y_max]]
+    counts, _, _ = np.histogram2d(x, y, bins=bins, range=grid)
+    if values is None:
+        image, norm = np.ma.masked_equal(counts, 0), LogNorm()
+    else:
+        sums, _, _ = np.histogram2d(x, y, bins=bins, range=grid, weights=np.asarray(values, dtype=np.float64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            image, norm = np.ma.masked_invalid(sums / counts), None
+    artist = ax.imshow(image.T, origin='lower', extent=(x_min, x_max, y_min, y_max), cmap=cmap, norm=norm,
+                       interpolation='nearest', aspect='equal')
+    plt.colorbar(artist, ax=ax, fraction=0.03)
+    return artist
+
+def decimate(x, y, episode, max_points=200):
+    """
+    Keeps at most max_points evenly spaced points (first and last included) of every episode.
+    :return: list of (n, 2) arrays, one per episode
+    """
+    x, y, episode = np.asarray(x), np.asarray(y), np.asarray(episode)
+    starts, stops = episode_store.episode_bounds(episode)
+    trajectories = []
+    for start, stop in zip(starts, stops):
+        rows = np.unique(np.linspace(start, stop - 1, min(max_points, stop - start)).astype(np.int64))
+        trajectories.append(np.column_stack([x[rows], y[rows]]))
+    return trajectories
+
+def plot_trajectories(ax, x, y, episode, max_episodes=None, max_points=200, alpha=0.1, color='g'):
+    """ decimated trajectories, every max_episodes-th episode when there are more, as one LineCollection """
+    trajectories = decimate(x, y, episode, max_points)
+    if max_episodes is not None and len(trajectories) > max_episodes:
+        trajectories = trajectories[::int(np.ceil(len(trajectories) / max_episodes))]
+    lines = LineCollection(trajectories, colors=color, linewidths=0.6, alpha=alpha)
+    ax.add_collection(lines)
+    ax.autoscale_view()
+    return lines
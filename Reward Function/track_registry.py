@@ -0,0 +1,125 @@
+"""
+Library of tracks for evaluating rewards across several tracks in one process.
+
+TrackRegistry lists the .npy track files of a directory (such as
+deepracer-k1999-race-lines/tracks) and loads a track, with its track artifacts,
+the first time it is asked for. Loaded tracks are kept in an LRU bounded by a
+memory budget. The artifacts come from track_cache, where the reward modules
+find them too, and the budget counts everything cached for a track there, so
+evicting a track frees what was counted for it.
+
+rescore() re-scores a mixed-track step store (see episode_store, with a 'track'
+column) in one pass: rows are grouped by track so each track is loaded once and
+all of its steps go through batch_evaluator together.
+
+    registry = TrackRegistry('deepracer-k1999-race-lines/tracks', memory_budget=256 * 2 ** 20)
+    rewards = rescore('reward_function', episode_store.load_columns('runs/all'), registry)
+"""
+import collections
+import math
+import os
+import threading
+
+import numpy as np
+
+import batch_evaluator
+import track_artifacts
+import track_cache
+from lap_estimator import Track, load_track
+
+# rough size of a waypoints list of tuples of floats, per waypoint
+WAYPOINT_LIST_BYTES = 112
+
+class TrackEntry:
+    def __init__(self, name, track_path):
+        center_line, inner_border, outer_border = load_track(track_path)
+        self.name = name
+        self.track = Track(center_line, np.linalg.norm(outer_border - inner_border, axis=1).mean())
+        self.inner_border = inner_border
+        self.outer_border = outer_border
+        self.key = track_cache.track_key(self.track.waypoints)
+        self.artifacts = track_artifacts.get_artifacts(self.track.waypoints, self.key)
+        arrays = [ center_line, inner_border, outer_border, self.track.segment, self.track.segment_length,
+                   self.track.segment_offset ]
+        self.own_nbytes = sum(array.nbytes for array in arrays) + WAYPOINT_LIST_BYTES * len(self.track.waypoints)
+
+    @property
+    def nbytes(self):
+        """ the track itself plus what is cached for it in track_cache, artifacts and reward module precomputes """
+        return self.own_nbytes + track_cache.track_nbytes(self.key)
+
+class TrackRegistry:
+    def __init__(self, track_dir, memory_budget=256 * 2 ** 20):
+        self.track_dir = track_dir
+        self.memory_budget = memory_budget
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self.entries.values())
+
+    def names(self):
+        return sorted(entry[:-len('.npy')] for entry in os.listdir(self.track_dir) if entry.endswith('.npy'))
+
+    def get(self, name):
+        """ the loaded track, most recently used tracks are kept within the memory budget """
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                self.entries.move_to_end(name)
+                return entry
+        entry = TrackEntry(name, os.path.join(self.track_dir, name + '.npy'))
+        with self.lock:
+            if name not in self.entries:
+                self.entries[name] = entry
+            self.evict(keep=name)
+            return self.entries[name]
+
+    def evict(self, keep=None):
+        # the track just asked for stays even when it alone is over budget
+        while self.nbytes > self.memory_budget and len(self.entries) > 1:
+            name, entry = next(iter(self.entries.items()))
+            if name == keep:
+                self.entries.move_to_end(name)
+                continue
+            del self.entries[name]
+            track_cache.release_track(entry.key)
+
+def build_params(entry, columns, rows):
+    """ params dicts of the store rows of one track """
+    track = entry.track
+    names = [ name for name in columns if name not in ('episode', 'reward', 'track') ]
+    values = { name: columns[name][rows].tolist() for name in names }
+    params_list = []
+    for i in range(len(rows)):
+        params = { name: values[name][i] for name in names }
+        params['waypoints'] = track.waypoints
+        params['track_width'] = track.track_width
+        params['track_length'] = track.length
+        params_list.append(params)
+    return params_list
+
+def rescore(module_name, columns, registry):
+    """
+    Rewards of every row of a mixed-track store under a reward module.
+    :param columns: store columns with a 'track' column naming the track of every row
+    :return: rewards in row order, NaN for the rows the module fails on
+    """
+    names, inverse = np.unique(np.asarray(columns['track']), return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+    rewards = [None] * len(inverse)
+    for track_index, name in enumerate(names):
+        rows = order[bounds[track_index]:bounds[track_index + 1]]
+        params_list = build_params(registry.get(str(name)), columns, rows)
+        try:
+            track_rewards = batch_evaluator.evaluate(module_name, params_list)
+        except Exception:
+            # an unknown module name still raises
+            batch_evaluator.load_module(module_name)
+            track_rewards = [ math.nan if isinstance(reward, Exception) else reward
+                              for reward in batch_evaluator.evaluate_each(module_name, params_list) ]
+        for row, reward in zip(rows, track_rewards):
+            rewards[row] = reward
+    return rewards